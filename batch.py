@@ -0,0 +1,249 @@
+import argparse
+import io
+import json
+import queue
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Tuple
+
+from vm import VirtualMachine, VirtualMachineStatus, VirtualMachineFault, VMState
+
+Script = namedtuple("Script", ["name", "commands", "error"], defaults=[None])
+
+class ScriptError(ValueError):
+    pass
+
+class BootError(Exception):
+    pass
+
+# Scripts submitted to the pool per worker before waiting for results
+QUEUE_DEPTH = 2
+
+_boot_image = None
+
+def boot(fname: str,
+         max_cycles: int | None = None,
+         timeout: float | None = None) -> Tuple[VMState, str]:
+    # The stack limit only applies to scripts, boot is bounded by the cycle
+    # budget and the deadline, which also stop runaway recursion.
+    vm = VirtualMachine.from_binary(fname)
+    vm.stdout = io.StringIO()
+    vm.break_on_input = True
+
+    deadline = time.monotonic() + timeout if timeout is not None else None
+
+    try:
+        status = vm.run(max_cycles=max_cycles, deadline=deadline)
+    except Exception as e:
+        raise BootError(f"{type(e).__name__}: {e}") from e
+
+    if status != VirtualMachineStatus.EXPECTING_INPUT:
+        raise BootError(f"expected an input prompt, stopped with status "
+                        f"{status.name.lower()} after {vm.ncycles} cycles")
+
+    return vm.get_state(), vm.stdout.getvalue() + vm.output_buffer
+
+def check_commands(commands) -> List[str]:
+    if not isinstance(commands, list) or not all(isinstance(c, str) for c in commands):
+        raise ScriptError("commands must be a list of strings")
+
+    return commands
+
+def parse_script(text: str) -> List[str]:
+    commands = []
+    for line in text.splitlines():
+        line = line.strip()
+        if len(line) == 0 or line.startswith("#"):
+            continue
+        commands.append(line)
+
+    return commands
+
+def read_scripts(fnames: List[str], stdin=sys.stdin) -> Iterator[Script]:
+    for fname in fnames:
+        if fname == "-":
+            yield from read_jsonl_scripts(stdin)
+        else:
+            try:
+                with open(fname) as f:
+                    yield Script(fname, parse_script(f.read()))
+            except OSError as e:
+                yield Script(fname, [], str(e))
+
+def read_jsonl_scripts(f) -> Iterator[Script]:
+    for n, line in enumerate(f):
+        if len(line.strip()) == 0:
+            continue
+
+        name = f"stdin:{n + 1}"
+        try:
+            entry = json.loads(line)
+            if isinstance(entry, dict):
+                name = str(entry.get("name", name))
+                if "commands" not in entry:
+                    raise ScriptError("missing 'commands'")
+                entry = entry["commands"]
+
+            yield Script(name, check_commands(entry))
+        except ValueError as e:
+            yield Script(name, [], str(e))
+
+def run_script(boot_image: VMState,
+               script: Script,
+               max_cycles: int | None = None,
+               timeout: float | None = None,
+               max_stack: int | None = None) -> dict:
+    name, commands, error = script
+
+    vm = VirtualMachine.from_state(boot_image)
+    vm.stdout = io.StringIO()
+    vm.break_on_input = True
+    vm.max_stack = max_stack
+
+    start = time.monotonic()
+    deadline = start + timeout if timeout is not None else None
+
+    ncommands = 0
+    status = "error"
+    try:
+        if error is not None:
+            raise ScriptError(error)
+
+        check_commands(commands)
+
+        while True:
+            budget = max_cycles - vm.ncycles if max_cycles is not None else None
+            status = vm.run(max_cycles=budget, deadline=deadline).name.lower()
+
+            if (vm.status != VirtualMachineStatus.EXPECTING_INPUT or
+                ncommands == len(commands)):
+                break
+
+            vm.input_buffer = commands[ncommands] + "\n"
+            ncommands += 1
+    except VirtualMachineFault as e:
+        status = vm.status.name.lower()
+        error = str(e)
+    except ScriptError as e:
+        error = str(e)
+    except Exception as e:
+        # Guest programs running into data, unknown opcodes or bad scripts
+        # only fail their own script
+        status = "error"
+        error = f"{type(e).__name__}: {e}"
+
+    result = {
+        "name": name,
+        "status": status,
+        "commands": ncommands,
+        "cycles": vm.ncycles,
+        "elapsed": round(time.monotonic() - start, 6),
+        "output": vm.stdout.getvalue() + vm.output_buffer,
+    }
+
+    if error is not None:
+        result["error"] = error
+
+    return result
+
+def _init_worker(boot_image: VMState) -> None:
+    global _boot_image
+    _boot_image = boot_image
+
+def _run_worker_script(args: Tuple[Script, int | None, float | None, int | None]) -> dict:
+    script, max_cycles, timeout, max_stack = args
+    return run_script(_boot_image, script, max_cycles, timeout, max_stack)
+
+def run_scripts(boot_image: VMState,
+                scripts: Iterable[Script],
+                workers: int = 1,
+                max_cycles: int | None = None,
+                timeout: float | None = None,
+                max_stack: int | None = None) -> Iterator[dict]:
+    if workers <= 1:
+        for script in scripts:
+            yield run_script(boot_image, script, max_cycles, timeout, max_stack)
+        return
+
+    # Scripts are read and submitted from a separate thread, so results are
+    # printed as soon as they finish while further input is still arriving.
+    window = threading.Semaphore(workers * QUEUE_DEPTH)
+    done = queue.Queue()
+
+    def submit(executor: ProcessPoolExecutor) -> None:
+        nsubmitted = 0
+        try:
+            for script in scripts:
+                window.acquire()
+                future = executor.submit(_run_worker_script,
+                                         (script, max_cycles, timeout, max_stack))
+                future.add_done_callback(done.put)
+                nsubmitted += 1
+        except BaseException as e:
+            done.put(e)
+        finally:
+            done.put(nsubmitted)
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_worker,
+                             initargs=(boot_image,)) as executor:
+        threading.Thread(target=submit, args=(executor,), daemon=True).start()
+
+        nsubmitted = None
+        nyielded = 0
+        while nsubmitted is None or nyielded < nsubmitted:
+            item = done.get()
+            if isinstance(item, int):
+                nsubmitted = item
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                window.release()
+                nyielded += 1
+                yield item.result()
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Run scripted sessions headlessly and print the results as JSON lines.")
+    parser.add_argument("scripts", nargs="*", default=["-"],
+                        help="script files with one command per line; '-' reads JSON lines "
+                             "(a list of commands or {\"name\": ..., \"commands\": [...]}) from stdin")
+    parser.add_argument("-b", "--binary", default="challenge.bin")
+    parser.add_argument("-j", "--workers", type=int, default=1)
+    parser.add_argument("-c", "--max-cycles", type=int, default=None,
+                        help="maximum number of cycles per script, counted from the boot image, "
+                             "and for booting")
+    parser.add_argument("-t", "--timeout", type=float, default=None,
+                        help="wall-clock limit per script and for booting in seconds")
+    parser.add_argument("-s", "--max-stack", type=int, default=None,
+                        help="maximum guest stack size, exceeding it faults the script")
+    parser.add_argument("--boot-output", action="store_true",
+                        help="print the output produced before the first prompt as a JSON line")
+    args = parser.parse_args(argv)
+
+    try:
+        boot_image, boot_output = boot(args.binary, args.max_cycles, args.timeout)
+    except (OSError, BootError) as e:
+        print(f"{parser.prog}: boot failed: {e}", file=sys.stderr)
+        return 1
+
+    if args.boot_output:
+        print(json.dumps({"name": "boot", "output": boot_output}), flush=True)
+
+    results = run_scripts(boot_image,
+                          read_scripts(args.scripts),
+                          workers=args.workers,
+                          max_cycles=args.max_cycles,
+                          timeout=args.timeout,
+                          max_stack=args.max_stack)
+
+    for result in results:
+        print(json.dumps(result), flush=True)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,11 @@
 import urwid
 from typing import Tuple, List
 
-from vm import VirtualMachine, VirtualMachineStatus, OpCode, OpCodeArguments
+from vm import VirtualMachine, VirtualMachineStatus, VirtualMachineFault
+from disassembly import Disassembler, format_opcode
 
 SCREEN_UPDATE_INTERVAL = 1000
 
-OPCODE_NAMES = [str(op).split(".")[1] for op in OpCode]
-
 PALETTE = [
     ("opcode", "light blue", "black", ()),
     ("args", "light green", "black", ()),
@@ -17,57 +16,34 @@ PALETTE = [
 
 NUM_PADDING = 6
 
-def disassemble_next(vm: VirtualMachine, pos: int) -> Tuple[str, List[int], int]:
-    op = vm.program[pos]
-    nargs = OpCodeArguments[op]
-    args = vm.program[pos + 1 : pos + 1 + nargs]
-
-    return (OPCODE_NAMES[op], args, pos + nargs + 1)
-
-def disassemble_prev(vm: VirtualMachine, pos: int) -> Tuple[str, List[int], int]:
-    k = 1
-    while vm.program[pos - k] not in range(22):
-        k += 1
-
-    pos = pos - k
-
-    op = vm.program[pos]
-    nargs = OpCodeArguments[op]
-    args = vm.program[pos + 1 : pos + 1 + nargs]
-
-    return (OPCODE_NAMES[op], args, pos)
-
-def disassemble(vm: VirtualMachine) -> List[Tuple[int, int, List[int]]]:
-    pos = 0
-    asm = []
-    while pos < len(vm.program):
-        op = vm.program[pos]
-        nargs = OpCodeArguments.get(op, 0)
-        args = vm.program[pos + 1 : pos + 1 + nargs]
-        asm.append((pos, op, args))
-        pos += nargs + 1
-
-    return asm
+# Number of values from the top of the stack shown in the Stack pane
+STACK_DISPLAY_DEPTH = 12
 
 class DisassemblyWalker(urwid.ListWalker):
     def __init__(self, vm: VirtualMachine, breakpoints: set):
         self.vm = vm
         self.breakpoints = breakpoints
 
-        self.asm = disassemble(self.vm)
+        self.disassembler = Disassembler(self.vm.program)
         self.focus = 0
         self.reset()
 
     def reset(self) -> None:
-        self.asm = disassemble(self.vm)
+        if self.vm.write_log:
+            for addr in set(self.vm.write_log):
+                self.disassembler.invalidate(addr)
+            self.vm.write_log.clear()
+
+        self.disassembler.verify(self.vm.pos)
 
-        i = 0
-        for vmpos, _, _ in self.asm:
-            if vmpos == self.vm.pos:
+        focus = self.vm.pos
+        for _ in range(2):
+            prev = self.disassembler.prev(focus)
+            if prev is None:
                 break
-            i += 1
+            focus = prev
 
-        self.set_focus(max(0, i - 2))
+        self.set_focus(focus)
 
     def get_focus(self) -> Tuple[urwid.Text, int] | Tuple[None, None]:
         return self._get_line_at(self.focus)
@@ -77,27 +53,25 @@ class DisassemblyWalker(urwid.ListWalker):
         self._modified()
 
     def get_next(self, pos: int) -> Tuple[urwid.Text, int] | Tuple[None, None]:
-        return self._get_line_at(pos + 1)
+        return self._get_line_at(self.disassembler.next(pos))
 
     def get_prev(self, pos: int) -> Tuple[urwid.Text, int] | Tuple[None, None]:
-        return self._get_line_at(pos - 1)
+        return self._get_line_at(self.disassembler.prev(pos))
 
-    def _get_line_at(self, pos: int) -> Tuple[urwid.Text, int] | Tuple[None, None]:
-        if pos < 0 or pos >= len(self.asm) or len(self.asm) == 0:
+    def _get_line_at(self, pos: int | None) -> Tuple[urwid.Text, int] | Tuple[None, None]:
+        if pos is None or pos < 0 or pos >= len(self.vm.program):
             return None, None
 
-        vmpos, opcode, args = self.asm[pos]
-        if opcode in range(22):
-            opcode = OPCODE_NAMES[opcode]
+        op, args, _ = self.disassembler.decode(pos)
 
-        mpos = ">" if vmpos == self.vm.pos else " "
-        mbrk = "o" if vmpos in self.breakpoints else " "
+        mpos = ">" if pos == self.vm.pos else " "
+        mbrk = "o" if pos in self.breakpoints else " "
 
         text = urwid.Text([("brk", mpos),
                            ("brk", mbrk),
                            " ",
-                           ("pos", str(vmpos).rjust(NUM_PADDING)),
-                           ("opcode", str(opcode).rjust(NUM_PADDING)),
+                           ("pos", str(pos).rjust(NUM_PADDING)),
+                           ("opcode", format_opcode(op, args).rjust(NUM_PADDING)),
                            ("args", "".join(str(a).rjust(NUM_PADDING) for a in args)),
                            ])
 
@@ -187,7 +161,9 @@ class VMDebugger():
         ])
 
         # stack
-        self.stack_widget = urwid.Text("")
+        self.stack_stats = urwid.Text("")
+        self.stack_values = urwid.Text("")
+        self.stack_widget = urwid.Pile([self.stack_stats, self.stack_values])
 
         # status line
         self.status_line = urwid.Text("")
@@ -226,6 +202,8 @@ class VMDebugger():
 
         self.vm.stdout = output_walker
         self.vm.break_on_input = True
+        self.vm.track_calls = True
+        self.vm.write_log = []
 
         self.update_status_widget(force_update=False)
 
@@ -262,19 +240,29 @@ class VMDebugger():
                 self.status_line.set_text(f"You pressed: {repr(key)}")
 
     def vm_step(self) -> None:
-        self.vm.step()
+        if self.vm.status in (VirtualMachineStatus.FINISHED, VirtualMachineStatus.FAULT):
+            return
+
+        try:
+            self.vm.step()
+        except VirtualMachineFault as e:
+            self.status_line.set_text(f"Fault: {e}")
+
         self.update_status_widget()
 
     def vm_run(self) -> None:
-        if self.vm.status == VirtualMachineStatus.FINISHED:
+        if self.vm.status in (VirtualMachineStatus.FINISHED, VirtualMachineStatus.FAULT):
             return
 
-        running = self.vm.step()
-        while running and self.vm.pos not in self.breakpoints:
+        try:
             running = self.vm.step()
+            while running and self.vm.pos not in self.breakpoints:
+                running = self.vm.step()
 
-            if self.vm.ncycles % SCREEN_UPDATE_INTERVAL == 0:
-                self.update_status_widget()
+                if self.vm.ncycles % SCREEN_UPDATE_INTERVAL == 0:
+                    self.update_status_widget()
+        except VirtualMachineFault as e:
+            self.status_line.set_text(f"Fault: {e}")
 
         self.update_status_widget()
 
@@ -282,6 +270,25 @@ class VMDebugger():
             self.input_widget.set_edit_text("")
             self.main_pile.focus_position = self.pile_indices["input"]
 
+    def update_stack_widget(self) -> None:
+        stack = self.vm.stack
+        limit = self.vm.max_stack if self.vm.max_stack is not None else "-"
+        frame = self.vm.call_stack[-1][0] if self.vm.call_depth > 0 else "-"
+
+        self.stack_stats.set_text([
+            ("label", "Size: "), f"{len(stack)}/{limit}",
+            ("label", "  High water: "), f"{self.vm.stack_high_water}",
+            ("label", "  Call depth: "), f"{self.vm.call_depth}",
+            ("label", "  Frame: "), ("pos", f"{frame}"),
+        ])
+
+        top = stack[-STACK_DISPLAY_DEPTH:]
+        values = [str(val).rjust(NUM_PADDING) for val in top]
+        if len(stack) > len(top):
+            values.insert(0, ("label", f"({len(stack) - len(top)} more)"))
+
+        self.stack_values.set_text(values)
+
     def update_status_widget(self, force_update : bool = True) -> None:
         self.text_position.set_text(["Position: ", ("pos", f"{self.vm.pos}")])
         self.text_ncycles.set_text(f"Cycles: {self.vm.ncycles}")
@@ -290,10 +297,7 @@ class VMDebugger():
 
         self.registers_line.set_text([str(val).rjust(NUM_PADDING) for val in self.vm.registers])
 
-        if len(self.vm.stack) > 0:
-            self.stack_widget.set_text([str(val).rjust(NUM_PADDING) for val in self.vm.stack])
-        else:
-            self.stack_widget.set_text("")
+        self.update_stack_widget()
 
         self.disassembly_walker.reset()
         self.disassembly_widget.set_focus_valign("top")
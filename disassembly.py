@@ -0,0 +1,99 @@
+import bisect
+from typing import Tuple, List, Iterator
+
+from vm import VirtualMachine, OpCode, OpCodeArguments
+
+OPCODE_NAMES = [op.name for op in OpCode]
+
+# Number of instructions between two cached boundaries in the disassembly index
+INDEX_STRIDE = 64
+
+def decode(program: list, pos: int, limit: int | None = None) -> Tuple[int, List[int], int]:
+    # Returns (op, args, next position). Words that are not an opcode, or whose
+    # instruction would run past `limit`, decode as a single data word.
+    if limit is None:
+        limit = len(program)
+
+    op = program[pos]
+    nargs = OpCodeArguments.get(op)
+    if nargs is None or pos + nargs + 1 > limit:
+        return op, [], pos + 1
+
+    return op, program[pos + 1 : pos + 1 + nargs], pos + nargs + 1
+
+def is_instruction(op: int, args: List[int]) -> bool:
+    return OpCodeArguments.get(op) == len(args)
+
+class Disassembler():
+    def __init__(self, program: list):
+        self.program = program
+
+        # Sorted instruction boundaries. Anchors are known to be code (entry
+        # point, positions the VM executed); checkpoints are recorded every
+        # INDEX_STRIDE instructions while decoding forward from a boundary.
+        self.anchors = [0]
+        self.checkpoints = []
+
+    def verify(self, pos: int) -> None:
+        i = bisect.bisect_left(self.anchors, pos)
+        if i < len(self.anchors) and self.anchors[i] == pos:
+            return
+
+        self.anchors.insert(i, pos)
+
+        # Checkpoints up to the next anchor may have been decoded across pos
+        self.invalidate(pos)
+
+    def invalidate(self, pos: int) -> None:
+        # Drops the checkpoints after pos up to the next anchor, decoding is
+        # resynchronised at anchors so later checkpoints stay valid. Call this
+        # whenever the word at pos changes.
+        end = self.next_anchor(pos)
+        lo = bisect.bisect_right(self.checkpoints, pos)
+        hi = bisect.bisect_left(self.checkpoints, end)
+        del self.checkpoints[lo:hi]
+
+    def next_anchor(self, pos: int) -> int:
+        i = bisect.bisect_right(self.anchors, pos)
+        return self.anchors[i] if i < len(self.anchors) else len(self.program)
+
+    def decode(self, pos: int) -> Tuple[int, List[int], int]:
+        return decode(self.program, pos, self.next_anchor(pos))
+
+    def next(self, pos: int) -> int | None:
+        _, _, pos = self.decode(pos)
+        return pos if pos < len(self.program) else None
+
+    def prev(self, pos: int) -> int | None:
+        if pos <= 0:
+            return None
+
+        i = bisect.bisect_left(self.anchors, pos)
+        j = bisect.bisect_left(self.checkpoints, pos)
+        start = self.anchors[i - 1]
+        if j > 0:
+            start = max(start, self.checkpoints[j - 1])
+
+        n = 0
+        while True:
+            _, _, next_pos = self.decode(start)
+            if next_pos >= pos:
+                return start
+
+            n += 1
+            if n % INDEX_STRIDE == 0:
+                bisect.insort(self.checkpoints, next_pos)
+
+            start = next_pos
+
+    def instructions(self, pos: int = 0) -> Iterator[Tuple[int, int, List[int]]]:
+        while pos < len(self.program):
+            op, args, next_pos = self.decode(pos)
+            yield pos, op, args
+            pos = next_pos
+
+def disassemble(vm: VirtualMachine, pos: int = 0) -> Iterator[Tuple[int, int, List[int]]]:
+    return Disassembler(vm.program).instructions(pos)
+
+def format_opcode(op: int, args: List[int]) -> str:
+    return OPCODE_NAMES[op] if is_instruction(op, args) else str(op)
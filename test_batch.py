@@ -0,0 +1,127 @@
+import io
+import struct
+
+import pytest
+
+from batch import (BootError, Script, boot, parse_script, read_jsonl_scripts,
+                   run_script, run_scripts)
+from vm import VirtualMachine
+
+R = 2**15
+
+# Prints "Hi", then echoes its input until it reads a "q"
+ECHO = [
+    19, ord("H"), 19, ord("i"), 19, ord("\n"),
+    20, R,                  #  6: IN   r0
+    4, R + 1, R, ord("q"),  #  8: EQ   r1 r0 'q'
+    7, R + 1, 22,           # 12: JT   r1 22
+    19, R,                  # 15: OUT  r0
+    6, 6,                   # 17: JMP  6
+    21, 21, 21,
+    0,                      # 22: HALT
+]
+
+def boot_image(program: list):
+    vm = VirtualMachine(program, stdout=io.StringIO(), break_on_input=True)
+    vm.run()
+
+    return vm.get_state()
+
+def write_binary(path, program: list) -> str:
+    path.write_bytes(b"".join(struct.pack("<H", w) for w in program))
+    return str(path)
+
+def test_parse_script():
+    assert parse_script("north\n\n  # comment\n take tablet \n") == ["north", "take tablet"]
+
+def test_read_jsonl_scripts():
+    lines = [
+        '["north", "south"]\n',
+        '\n',
+        '{"name": "named", "commands": ["inv"]}\n',
+        'not json\n',
+        '[1]\n',
+        '{"name": "empty"}\n',
+    ]
+    scripts = list(read_jsonl_scripts(io.StringIO("".join(lines))))
+
+    assert scripts[0] == Script("stdin:1", ["north", "south"])
+    assert scripts[1] == Script("named", ["inv"])
+    assert [s.name for s in scripts[2:]] == ["stdin:4", "stdin:5", "empty"]
+    assert all(s.error is not None for s in scripts[2:])
+
+def test_boot(tmp_path):
+    _, output = boot(write_binary(tmp_path / "echo.bin", ECHO))
+    assert output == "Hi\n"
+
+    with pytest.raises(BootError):
+        boot(write_binary(tmp_path / "halt.bin", [0]))
+
+    with pytest.raises(BootError):
+        boot(write_binary(tmp_path / "loop.bin", [6, 0]), max_cycles=1000)
+
+def test_run_script_feeds_commands():
+    result = run_script(boot_image(ECHO), Script("echo", ["ab", "cd", "q"]))
+
+    assert result["status"] == "finished"
+    assert result["commands"] == 3
+    assert result["output"] == "ab\ncd\n"
+    assert "error" not in result
+
+def test_run_script_out_of_commands():
+    result = run_script(boot_image(ECHO), Script("echo", ["ab"]))
+
+    assert result["status"] == "expecting_input"
+    assert result["commands"] == 1
+    assert result["output"] == "ab\n"
+
+def test_run_script_limits():
+    # IN r0; JMP 2
+    image = boot_image([20, R, 6, 2])
+
+    result = run_script(image, Script("loop", ["x"]), max_cycles=1000)
+    assert result["status"] == "cycle_limit"
+    assert result["cycles"] == 1000
+
+    result = run_script(image, Script("loop", ["x"]), timeout=0)
+    assert result["status"] == "timeout"
+    assert result["cycles"] == 0
+
+def test_run_script_fault():
+    # IN r0; POP r1
+    result = run_script(boot_image([20, R, 3, R + 1]), Script("pop", ["x"]))
+    assert result["status"] == "fault"
+    assert "error" in result
+
+    # IN r0; CALL 2
+    result = run_script(boot_image([20, R, 17, 2]), Script("call", ["x"]), max_stack=10)
+    assert result["status"] == "fault"
+    assert result["cycles"] == 11
+
+def test_run_script_errors():
+    # IN r0; followed by data
+    result = run_script(boot_image([20, R, 500]), Script("data", ["x"]))
+    assert result["status"] == "error"
+    assert result["error"].startswith("KeyError")
+
+    result = run_script(boot_image(ECHO), Script("bad", [1]))
+    assert result["status"] == "error"
+    assert result["commands"] == 0
+
+    result = run_script(boot_image(ECHO), Script("bad", [], "unreadable"))
+    assert result["status"] == "error"
+    assert result["error"] == "unreadable"
+
+def test_run_scripts_workers():
+    scripts = [Script(f"echo{n}", [str(n), "q"]) for n in range(8)]
+    scripts.append(Script("bad", [], "unreadable"))
+
+    results = list(run_scripts(boot_image(ECHO), iter(scripts), workers=2))
+
+    assert sorted(r["name"] for r in results) == sorted(s.name for s in scripts)
+    for result in results:
+        if result["name"] == "bad":
+            assert result["status"] == "error"
+        else:
+            assert result["status"] == "finished"
+            assert result["output"] == result["name"][len("echo"):] + "\n"
@@ -0,0 +1,81 @@
+import random
+
+from disassembly import Disassembler, INDEX_STRIDE
+from vm import VirtualMachine, OpCodeArguments
+
+def random_program(size: int, seed: int) -> list:
+    rng = random.Random(seed)
+
+    program = []
+    while len(program) < size:
+        if rng.random() < 0.1:
+            # data mixed into code
+            program += [rng.randrange(2**16) for _ in range(rng.randrange(1, 20))]
+        else:
+            op = rng.randrange(len(OpCodeArguments))
+            program += [op] + [rng.randrange(100) for _ in range(OpCodeArguments[op])]
+
+    return program[:size]
+
+def boundaries(dis: Disassembler) -> list:
+    return [pos for pos, _, _ in dis.instructions()]
+
+def check_index(dis: Disassembler) -> None:
+    expected = boundaries(dis)
+    for prev, pos in zip(expected, expected[1:]):
+        assert dis.next(prev) == pos
+        assert dis.prev(pos) == prev
+
+def test_prev_matches_forward_decode():
+    dis = Disassembler(random_program(5000, seed=1))
+    dis.verify(1234)
+    dis.verify(3001)
+
+    check_index(dis)
+    assert len(dis.checkpoints) > 0
+
+def test_prev_after_write():
+    program = [21] * 2000
+    dis = Disassembler(program)
+    dis.prev(1999)
+    assert len(dis.checkpoints) > 0
+
+    program[62] = 9
+    dis.invalidate(62)
+
+    assert dis.next(62) == 66
+    assert dis.prev(66) == 62
+    assert dis.prev(62) == 61
+
+def test_index_after_random_writes():
+    rng = random.Random(2)
+    program = random_program(5000, seed=3)
+    dis = Disassembler(program)
+    dis.verify(2500)
+
+    for _ in range(20):
+        dis.prev(len(program) - 1)
+
+        # an ADD just before a cached boundary swallows it
+        addr = rng.choice(dis.checkpoints) - rng.randrange(1, 4)
+        program[addr] = 9
+        dis.invalidate(addr)
+
+        check_index(dis)
+
+def test_write_log():
+    # WMEM 128 9; HALT
+    vm = VirtualMachine([16, 128, 9, 0] + [21] * (4 * INDEX_STRIDE))
+    vm.write_log = []
+    dis = Disassembler(vm.program)
+    dis.prev(len(vm.program) - 1)
+
+    vm.run()
+    assert vm.write_log == [128]
+    assert 130 in dis.checkpoints
+
+    for addr in vm.write_log:
+        dis.invalidate(addr)
+
+    assert dis.next(128) == 132
+    assert dis.prev(132) == 128
@@ -0,0 +1,166 @@
+import time
+
+import pytest
+
+from vm import VirtualMachine, VirtualMachineStatus, StackOverflow, StackUnderflow, CallStats
+
+R = 2**15
+
+# JMP 0
+LOOP = [6, 0]
+
+def test_run_budget_from_current_cycles():
+    vm = VirtualMachine(list(LOOP))
+    vm.ncycles = 500
+
+    assert vm.run(max_cycles=100) == VirtualMachineStatus.CYCLE_LIMIT
+    assert vm.ncycles == 600
+
+def test_run_resumes_after_cycle_limit():
+    vm = VirtualMachine(list(LOOP))
+
+    assert vm.run(max_cycles=5) == VirtualMachineStatus.CYCLE_LIMIT
+    assert vm.status == VirtualMachineStatus.CYCLE_LIMIT
+    assert vm.run(max_cycles=7) == VirtualMachineStatus.CYCLE_LIMIT
+    assert vm.ncycles == 12
+
+def test_run_resumes_after_timeout():
+    vm = VirtualMachine(list(LOOP))
+
+    assert vm.run(deadline=time.monotonic() + 0.01) == VirtualMachineStatus.TIMEOUT
+    ncycles = vm.ncycles
+    assert ncycles > 0
+
+    assert vm.run(max_cycles=10) == VirtualMachineStatus.CYCLE_LIMIT
+    assert vm.ncycles == ncycles + 10
+
+def test_run_expired_deadline():
+    vm = VirtualMachine(list(LOOP))
+
+    assert vm.run(deadline=time.monotonic() - 1) == VirtualMachineStatus.TIMEOUT
+    assert vm.ncycles == 0
+
+def test_run_iter_interval():
+    vm = VirtualMachine(list(LOOP))
+
+    cycles = []
+    for status in vm.run_iter(interval=3, max_cycles=10):
+        cycles.append((status, vm.ncycles))
+
+    running = VirtualMachineStatus.RUNNING
+    assert cycles == [(running, 3), (running, 6), (running, 9), (running, 10),
+                      (VirtualMachineStatus.CYCLE_LIMIT, 10)]
+
+def test_run_iter_rejects_interval():
+    vm = VirtualMachine(list(LOOP))
+
+    with pytest.raises(ValueError):
+        vm.run_iter(interval=0)
+
+def test_run_halt():
+    # NOOP; HALT
+    vm = VirtualMachine([21, 0])
+
+    assert vm.run() == VirtualMachineStatus.FINISHED
+    assert vm.ncycles == 1
+
+def test_ret_on_empty_stack_finishes():
+    vm = VirtualMachine([18])
+
+    assert vm.run() == VirtualMachineStatus.FINISHED
+
+def test_run_break_on_input():
+    # IN r0; HALT
+    vm = VirtualMachine([20, R, 0], break_on_input=True)
+
+    assert vm.run() == VirtualMachineStatus.EXPECTING_INPUT
+    assert vm.pos == 0
+
+    vm.input_buffer = "a"
+    assert vm.run() == VirtualMachineStatus.FINISHED
+    assert vm.registers[0] == ord("a")
+
+# CALL 10 twice, 10 pushes one value and calls 20, which pushes two more
+CALLS = [
+    17, 10,         #  0: CALL 10
+    17, 10,         #  2: CALL 10
+    0,              #  4: HALT
+    21, 21, 21, 21, 21,
+    2, 1,           # 10: PUSH 1
+    17, 20,         # 12: CALL 20
+    3, R,           # 14: POP  r0
+    18,             # 16: RET
+    21, 21, 21,
+    2, 5,           # 20: PUSH 5
+    2, 6,           # 22: PUSH 6
+    3, R + 1,       # 24: POP  r1
+    3, R + 1,       # 26: POP  r1
+    18,             # 28: RET
+]
+
+def test_push_stack_overflow():
+    # PUSH 1; PUSH 2; PUSH 3
+    vm = VirtualMachine([2, 1, 2, 2, 2, 3, 0], max_stack=2)
+
+    with pytest.raises(StackOverflow):
+        vm.run()
+
+    assert vm.status == VirtualMachineStatus.FAULT
+    assert vm.pos == 4
+    assert vm.stack == [1, 2]
+
+def test_call_stack_overflow():
+    # CALL 0
+    vm = VirtualMachine([17, 0], max_stack=3)
+
+    with pytest.raises(StackOverflow):
+        vm.run()
+
+    assert vm.status == VirtualMachineStatus.FAULT
+    assert vm.pos == 0
+    assert vm.stack == [2, 2, 2]
+
+def test_pop_stack_underflow():
+    # NOOP; POP r0
+    vm = VirtualMachine([21, 3, R])
+
+    with pytest.raises(StackUnderflow):
+        vm.run()
+
+    assert vm.status == VirtualMachineStatus.FAULT
+    assert vm.pos == 1
+
+def test_call_stats():
+    vm = VirtualMachine(list(CALLS), track_calls=True)
+
+    assert vm.run() == VirtualMachineStatus.FINISHED
+    assert vm.call_depth == 0
+    assert vm.stack_high_water == 5
+    assert vm.get_call_stats() == {
+        10: CallStats(ncalls=2, max_depth=1, stack_high_water=5),
+        20: CallStats(ncalls=2, max_depth=2, stack_high_water=5),
+    }
+
+def test_call_stats_active_frames():
+    vm = VirtualMachine(list(CALLS), track_calls=True)
+
+    # CALL 10; PUSH 1; CALL 20; PUSH 5; PUSH 6
+    vm.run(max_cycles=5)
+
+    assert vm.call_depth == 2
+    assert vm.stack_high_water == 5
+    assert vm.get_call_stats() == {
+        10: CallStats(ncalls=1, max_depth=1, stack_high_water=5),
+        20: CallStats(ncalls=1, max_depth=2, stack_high_water=5),
+    }
+
+    # Active frames have not reported their high-water mark on RET yet
+    assert vm.call_stats[10][2] == 1
+    assert vm.call_stack == [[10, 3], [20, 5]]
+
+def test_call_tracking_disabled():
+    vm = VirtualMachine(list(CALLS))
+
+    assert vm.run() == VirtualMachineStatus.FINISHED
+    assert vm.call_stats == {}
+    assert vm.stack_high_water == 0
@@ -1,11 +1,15 @@
 from enum import IntEnum
 from collections import namedtuple
-from typing import Tuple, List
+from typing import Tuple, List, Iterator
 import struct
 import sys
+import time
 
 SIZE = 2**15
 
+# Number of cycles run between two checks of the wall-clock deadline
+RUN_SLICE = 10000
+
 class OpCode(IntEnum):
     HALT =  0
     SET  =  1
@@ -59,15 +63,30 @@ class VirtualMachineStatus(IntEnum):
     FINISHED        = 0
     RUNNING         = 1
     EXPECTING_INPUT = 2
+    CYCLE_LIMIT     = 3
+    TIMEOUT         = 4
+    FAULT           = 5
 
 VMState = namedtuple("VMState", ["program", "registers", "stack", "pos", "status"])
+CallStats = namedtuple("CallStats", ["ncalls", "max_depth", "stack_high_water"])
+
+class VirtualMachineFault(Exception):
+    pass
+
+class StackOverflow(VirtualMachineFault):
+    pass
+
+class StackUnderflow(VirtualMachineFault):
+    pass
 
 class VirtualMachine:
     def __init__(self,
                  program: list,
                  stdin=sys.stdin,
                  stdout=sys.stdout,
-                 break_on_input : bool = False):
+                 break_on_input : bool = False,
+                 max_stack : int | None = None,
+                 track_calls : bool = False):
         self.program = program
         self.registers = [0] * 8
         self.stack = []
@@ -80,6 +99,18 @@ class VirtualMachine:
         self.ncycles = 0
 
         self.break_on_input = break_on_input
+        self.max_stack = max_stack
+
+        # Call tracking: shadow frames of [target, stack high-water] and
+        # per-target [ncalls, max_depth, stack_high_water]
+        self.track_calls = track_calls
+        self.call_stack = []
+        self.call_stats = {}
+        self.stack_high_water = 0
+
+        # Addresses written by WMEM, collected when set to a list
+        self.write_log = None
+
         self.status = VirtualMachineStatus.RUNNING
 
     def __repr__(self) -> str:
@@ -121,6 +152,67 @@ class VirtualMachine:
 
         return op, args
 
+    @property
+    def call_depth(self) -> int:
+        return len(self.call_stack)
+
+    def get_call_stats(self) -> dict:
+        stats = {target: CallStats(*s) for target, s in self.call_stats.items()}
+
+        # Active frames only report their high-water mark to the caller on RET
+        high_water = 0
+        for target, frame_high_water in reversed(self.call_stack):
+            high_water = max(high_water, frame_high_water)
+            if high_water > stats[target].stack_high_water:
+                stats[target] = stats[target]._replace(stack_high_water=high_water)
+
+        return stats
+
+    def push(self, value: int) -> None:
+        if self.max_stack is not None and len(self.stack) >= self.max_stack:
+            # PUSH and CALL both take one argument, point back at the instruction
+            self.pos -= 2
+            self.status = VirtualMachineStatus.FAULT
+            raise StackOverflow(f"Stack limit of {self.max_stack} exceeded at {self.pos}")
+
+        self.stack.append(value)
+
+        if self.track_calls:
+            n = len(self.stack)
+            if n > self.stack_high_water:
+                self.stack_high_water = n
+            if len(self.call_stack) > 0 and n > self.call_stack[-1][1]:
+                self.call_stack[-1][1] = n
+
+    def pop(self) -> int:
+        if len(self.stack) == 0:
+            # POP takes one argument, point back at the instruction
+            self.pos -= 2
+            self.status = VirtualMachineStatus.FAULT
+            raise StackUnderflow(f"Pop from empty stack at {self.pos}")
+
+        return self.stack.pop()
+
+    def enter_call(self, target: int) -> None:
+        self.call_stack.append([target, len(self.stack)])
+
+        stats = self.call_stats.setdefault(target, [0, 0, 0])
+        stats[0] += 1
+        stats[1] = max(stats[1], len(self.call_stack))
+        stats[2] = max(stats[2], len(self.stack))
+
+    def leave_call(self) -> None:
+        if len(self.call_stack) == 0:
+            return
+
+        target, high_water = self.call_stack.pop()
+
+        stats = self.call_stats[target]
+        stats[2] = max(stats[2], high_water)
+
+        if len(self.call_stack) > 0:
+            self.call_stack[-1][1] = max(self.call_stack[-1][1], high_water)
+
     def get_value(self, n: int) -> int:
         if n < SIZE:
             return n
@@ -143,10 +235,10 @@ class VirtualMachine:
                 self.registers[args[0] % SIZE] = self.get_value(args[1])
 
             case OpCode.PUSH:
-                self.stack.append(self.get_value(args[0]))
+                self.push(self.get_value(args[0]))
 
             case OpCode.POP:
-                self.registers[args[0] % SIZE] = self.stack.pop()
+                self.registers[args[0] % SIZE] = self.pop()
 
             case OpCode.EQ:
                 if self.get_value(args[1]) == self.get_value(args[2]):
@@ -203,17 +295,28 @@ class VirtualMachine:
                 self.registers[args[0] % SIZE] = self.program[self.get_value(args[1])]
 
             case OpCode.WMEM:
-                self.program[self.get_value(args[0])] = self.get_value(args[1])
+                addr = self.get_value(args[0])
+                self.program[addr] = self.get_value(args[1])
+
+                if self.write_log is not None:
+                    self.write_log.append(addr)
 
             case OpCode.CALL:
-                self.stack.append(self.pos)
+                self.push(self.pos)
                 self.pos = self.get_value(args[0])
 
+                if self.track_calls:
+                    self.enter_call(self.pos)
+
             case OpCode.RET:
                 if len(self.stack) == 0:
+                    self.status = VirtualMachineStatus.FINISHED
                     return False
                 self.pos = self.stack.pop()
 
+                if self.track_calls:
+                    self.leave_call()
+
             case OpCode.OUT:
                 self.output_buffer += chr(self.get_value(args[0]))
 
@@ -240,14 +343,51 @@ class VirtualMachine:
 
         return True
 
-    def run(self) -> bool:
+    def run_iter(self,
+                 interval: int = RUN_SLICE,
+                 max_cycles: int | None = None,
+                 deadline: float | None = None) -> Iterator[VirtualMachineStatus]:
+        # Yields the status every `interval` cycles and stops after the first
+        # status other than RUNNING. `max_cycles` is a budget relative to the
+        # current cycle count, `deadline` an absolute time.monotonic() value.
+        # Calling run() or run_iter() again resumes where the last call stopped.
+        if interval < 1:
+            raise ValueError(f"interval must be at least 1, got {interval}")
+
+        return self._run_slices(interval, max_cycles, deadline)
+
+    def _run_slices(self,
+                    interval: int,
+                    max_cycles: int | None,
+                    deadline: float | None) -> Iterator[VirtualMachineStatus]:
         self.status = VirtualMachineStatus.RUNNING
 
-        running = self.step()
+        stop = self.ncycles + max_cycles if max_cycles is not None else None
+        step = self.step
+
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                self.status = VirtualMachineStatus.TIMEOUT
+                yield self.status
+                return
+
+            n = interval if stop is None else min(interval, stop - self.ncycles)
+            if n <= 0:
+                self.status = VirtualMachineStatus.CYCLE_LIMIT
+                yield self.status
+                return
+
+            for _ in range(n):
+                if not step():
+                    yield self.status
+                    return
 
-        while running:
-            running = self.step()
+            yield self.status
 
-        return running
+    def run(self,
+            max_cycles: int | None = None,
+            deadline: float | None = None) -> VirtualMachineStatus:
+        for status in self.run_iter(max_cycles=max_cycles, deadline=deadline):
+            pass
 
-VM = VirtualMachine.from_binary("challenge.bin")
+        return status